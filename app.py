@@ -1,29 +1,50 @@
 import os
+import time
 import uuid
 import threading
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
 from PIL import Image
 from services.sora_client import SoraClient
 from services.story_processor import StoryProcessor
-from config import OUTPUT_DIR, VIDEO_WIDTH, VIDEO_HEIGHT
+from services.image_processor import resize_cover
+from services.job_store import load_job
+from services.job_repair import repair_job
+from services.latency_model import latency_model
+from services.key_pool import get_key_pool
+from services import tracing
+from services.tracing import Tracer
+from config import (
+    OUTPUT_DIR,
+    VIDEO_WIDTH,
+    VIDEO_HEIGHT,
+    DRAFT_MODEL,
+    DRAFT_DURATION,
+    TRACE_ENABLED,
+    TRACE_PROFILE,
+)
 
 app = Flask(__name__)
 
 # Store clip status in memory
 clips = {}
 
+# Store job repair status in memory
+jobs = {}
 
-def _resize_cover(img: Image.Image, target_w: int, target_h: int) -> Image.Image:
-    """Resize and center-crop an image to exactly target_w x target_h."""
-    src_w, src_h = img.size
-    scale = max(target_w / src_w, target_h / src_h)
-    new_w = round(src_w * scale)
-    new_h = round(src_h * scale)
-    img = img.resize((new_w, new_h), Image.LANCZOS)
-    left = (new_w - target_w) // 2
-    top = (new_h - target_h) // 2
-    img = img.crop((left, top, left + target_w, top + target_h))
-    return img.convert("RGB")
+
+def _make_tracer(job_id: str, trace) -> Tracer:
+    """
+    Build a tracer for a job if tracing was requested or is on by config.
+
+    `trace` is the request's "trace" value: true/"1" to trace, or a profile
+    mode ("cprofile" / "tracemalloc") to also profile CPU-bound stages.
+    """
+    trace = str(trace or "").strip().lower()
+    if trace in Tracer.PROFILE_MODES:
+        return Tracer(job_id, os.path.join(OUTPUT_DIR, job_id), profile=trace)
+    if trace in ("1", "true", "on") or TRACE_ENABLED:
+        return Tracer(job_id, os.path.join(OUTPUT_DIR, job_id), profile=TRACE_PROFILE)
+    return None
 
 
 @app.route("/")
@@ -41,6 +62,8 @@ def generate_clip():
         ref_file = request.files.get("reference_image")
         api_key = (request.form.get("api_key") or "").strip() or None
         model = (request.form.get("model") or "sora-2").strip()
+        draft = request.form.get("draft", "").lower() in ("1", "true", "on")
+        trace = request.form.get("trace")
     else:
         data = request.get_json()
         prompt = data.get("prompt", "").strip()
@@ -48,6 +71,8 @@ def generate_clip():
         ref_file = None
         api_key = (data.get("api_key") or "").strip() or None
         model = data.get("model", "sora-2")
+        draft = bool(data.get("draft", False))
+        trace = data.get("trace")
 
     if not prompt:
         return jsonify({"error": "No prompt provided"}), 400
@@ -56,7 +81,13 @@ def generate_clip():
     if duration not in valid_durations:
         return jsonify({"error": f"Duration must be one of {valid_durations} for {model}"}), 400
 
+    # In draft mode the requested model/duration are kept for finalize, and a
+    # fast short preview is rendered first
+    stage = "draft" if draft else "final"
+    render_model, render_duration = (DRAFT_MODEL, DRAFT_DURATION) if draft else (model, duration)
+
     clip_id = str(uuid.uuid4())[:8]
+    tracer = _make_tracer(clip_id, trace)
 
     # Save reference image if provided, resized to match Sora's required dimensions
     reference_image_path = None
@@ -65,37 +96,113 @@ def generate_clip():
         os.makedirs(clip_dir, exist_ok=True)
         reference_image_path = os.path.join(clip_dir, "reference.png")
 
-        img = Image.open(ref_file)
-        img = _resize_cover(img, VIDEO_WIDTH, VIDEO_HEIGHT)
-        img.save(reference_image_path, format="PNG")
+        with tracing.activate(tracer), tracing.span("app.resize_cover", profile=True):
+            img = Image.open(ref_file)
+            img = resize_cover(img, VIDEO_WIDTH, VIDEO_HEIGHT)
+            img.save(reference_image_path, format="PNG")
 
     clips[clip_id] = {
         "status": "generating",
+        "stage": stage,
         "prompt": prompt,
-        "duration": duration,
+        "duration": render_duration,
+        "model": render_model,
+        "final_model": model,
+        "final_duration": duration,
+        "reference_image_path": reference_image_path,
+        "has_reference": reference_image_path is not None,
+        "started_at": time.time(),
         "video_path": None,
+        "draft_video_path": None,
+        "tracer": tracer,
         "error": None,
     }
 
     thread = threading.Thread(
         target=_run_clip_generation,
-        args=(clip_id, prompt, duration, reference_image_path, api_key, model),
+        args=(clip_id, prompt, render_duration, reference_image_path, api_key, render_model, stage),
+        kwargs={"tracer": tracer, "queued_at": time.time()},
+    )
+    thread.start()
+
+    return jsonify({"clip_id": clip_id, "status": "generating", "stage": stage})
+
+
+@app.route("/api/finalize-clip/<clip_id>", methods=["POST"])
+def finalize_clip(clip_id):
+    """Queue the full-quality render for a draft clip, reusing its prompt and reference image."""
+    if clip_id not in clips:
+        return jsonify({"error": "Clip not found"}), 404
+
+    clip = clips[clip_id]
+
+    # Drafts can be finalized, and so can a draft whose final render failed
+    retry_final = clip["draft_video_path"] is not None and clip["status"] == "failed"
+    if clip["stage"] != "draft" and not retry_final:
+        return jsonify({"error": "Clip is not a draft"}), 400
+
+    if clip["status"] == "generating":
+        return jsonify({"error": "Draft is still generating"}), 400
+
+    data = request.get_json(silent=True) or {}
+    api_key = (data.get("api_key") or "").strip() or None
+    model = data.get("model", clip["final_model"])
+    # Keep appending to the draft's timeline so both stages share one trace
+    tracer = clip["tracer"] or _make_tracer(clip_id, data.get("trace"))
+    duration = data.get("duration", clip["final_duration"])
+
+    valid_durations = SoraClient.VALID_DURATIONS.get(model, [4, 8, 12])
+    if duration not in valid_durations:
+        return jsonify({"error": f"Duration must be one of {valid_durations} for {model}"}), 400
+
+    clip.update({
+        "status": "generating",
+        "stage": "final",
+        "model": model,
+        "duration": duration,
+        "started_at": time.time(),
+        "video_path": None,
+        "tracer": tracer,
+        "error": None,
+    })
+
+    thread = threading.Thread(
+        target=_run_clip_generation,
+        args=(clip_id, clip["prompt"], duration, clip["reference_image_path"], api_key, model, "final"),
+        kwargs={"tracer": tracer, "queued_at": time.time()},
     )
     thread.start()
 
-    return jsonify({"clip_id": clip_id, "status": "generating"})
+    return jsonify({"clip_id": clip_id, "status": "generating", "stage": "final"})
 
 
-def _run_clip_generation(clip_id: str, prompt: str, duration: int, reference_image_path: str = None, api_key: str = None, model: str = "sora-2"):
+def _run_clip_generation(clip_id: str, prompt: str, duration: int, reference_image_path: str = None, api_key: str = None, model: str = "sora-2", stage: str = "final", tracer: Tracer = None, queued_at: float = None):
     """Generate a single clip in a background thread."""
+    with tracing.activate(tracer):
+        if tracer and queued_at:
+            tracer.record("app.thread_start", queued_at, time.time())
+        try:
+            with tracing.span("app.generate_clip", stage=stage, model=model, seconds=duration):
+                _generate_clip(clip_id, prompt, duration, reference_image_path, api_key, model, stage)
+        finally:
+            if tracer:
+                tracer.write()
+
+
+def _generate_clip(clip_id: str, prompt: str, duration: int, reference_image_path: str, api_key: str, model: str, stage: str):
+    """Body of _run_clip_generation: render one stage and update the clip's status."""
     try:
         sora = SoraClient(clip_duration=duration, api_key=api_key, model=model)
         clip_data = {"id": 1, "visual_prompt": prompt}
-        result = sora.generate_clip(clip_data, clip_id, reference_image_path=reference_image_path)
+        # Drafts go in their own folder so the final render doesn't overwrite them
+        job_id = os.path.join(clip_id, "draft") if stage == "draft" else clip_id
+        result = sora.generate_clip(clip_data, job_id, reference_image_path=reference_image_path)
 
         if result["status"] == "completed":
             clips[clip_id]["status"] = "completed"
             clips[clip_id]["video_path"] = result["video_path"]
+            if stage == "draft":
+                clips[clip_id]["draft_video_path"] = result["video_path"]
         else:
             clips[clip_id]["status"] = "failed"
             clips[clip_id]["error"] = result.get("error", "Generation failed")
@@ -139,10 +246,25 @@ def clip_status(clip_id):
         return jsonify({"error": "Clip not found"}), 404
 
     clip = clips[clip_id]
+
+    eta_seconds = None
+    if clip["status"] == "generating":
+        eta = latency_model.eta(
+            clip["model"],
+            clip["duration"],
+            clip["has_reference"],
+            time.time() - clip["started_at"],
+        )
+        eta_seconds = round(eta) if eta is not None else None
+
     return jsonify({
         "clip_id": clip_id,
         "status": clip["status"],
+        "stage": clip["stage"],
+        "has_draft": clip["draft_video_path"] is not None,
+        "traced": clip["tracer"] is not None,
         "error": clip["error"],
+        "eta_seconds": eta_seconds,
     })
 
 
@@ -170,19 +292,147 @@ def download_clip(clip_id):
 
 @app.route("/api/preview-clip/<clip_id>")
 def preview_clip(clip_id):
-    """Stream a clip for inline video playback."""
+    """Stream a clip for inline video playback (?stage=draft for the draft preview)."""
     if clip_id not in clips:
         return jsonify({"error": "Clip not found"}), 404
 
     clip = clips[clip_id]
 
-    if clip["status"] != "completed":
-        return jsonify({"error": "Clip not ready"}), 400
+    # The draft stays viewable while the final render is in progress
+    if request.args.get("stage") == "draft":
+        video_path = clip["draft_video_path"]
+        if not video_path:
+            return jsonify({"error": "Clip has no draft"}), 404
+    else:
+        if clip["status"] != "completed":
+            return jsonify({"error": "Clip not ready"}), 400
+        video_path = clip["video_path"]
 
-    if not clip["video_path"] or not os.path.exists(clip["video_path"]):
+    if not video_path or not os.path.exists(video_path):
         return jsonify({"error": "Video file not found"}), 404
 
-    return send_file(clip["video_path"], mimetype="video/mp4")
+    return send_file(video_path, mimetype="video/mp4")
+
+
+@app.route("/api/repair-job/<job_id>", methods=["POST"])
+def repair_job_route(job_id):
+    """Regenerate a job's failed or missing clips and rebuild its final video."""
+    if not load_job(job_id):
+        # Only jobs generated with SoraClient.generate_all_clips have a job.json
+        return jsonify({"error": "Job not found (no job.json record to repair from)"}), 404
+
+    if jobs.get(job_id, {}).get("status") == "repairing":
+        return jsonify({"error": "Job is already being repaired"}), 409
+
+    data = request.get_json(silent=True) or {}
+    api_key = (data.get("api_key") or "").strip() or None
+    package_hls = data.get("package_hls")
+    tracer = _make_tracer(job_id, data.get("trace"))
+
+    jobs[job_id] = {"status": "repairing", "output_path": None, "error": None}
+
+    thread = threading.Thread(
+        target=_run_job_repair,
+        args=(job_id, api_key, package_hls, tracer),
+    )
+    thread.start()
+
+    return jsonify({"job_id": job_id, "status": "repairing"})
+
+
+def _run_job_repair(job_id: str, api_key: str = None, package_hls: bool = None, tracer: Tracer = None):
+    """Repair a job in a background thread."""
+    try:
+        with tracing.activate(tracer):
+            result = repair_job(job_id, api_key=api_key, package_hls=package_hls)
+
+        if result["status"] == "completed":
+            jobs[job_id]["status"] = "completed"
+            jobs[job_id]["output_path"] = result["output_path"]
+            jobs[job_id]["missing_clips"] = result["missing_clips"]
+            jobs[job_id]["repaired_clips"] = result["repaired_clips"]
+            if "hls" in result:
+                # Packaging can fail while the final video itself is fine
+                hls = result["hls"]
+                jobs[job_id]["hls"] = {
+                    "status": hls["status"],
+                    "hls_url": hls.get("hls_url"),
+                    "error": hls.get("error"),
+                }
+        else:
+            jobs[job_id]["status"] = "failed"
+            jobs[job_id]["error"] = result.get("error", "Repair failed")
+    except Exception as e:
+        jobs[job_id]["status"] = "failed"
+        jobs[job_id]["error"] = str(e)
+    finally:
+        if tracer:
+            tracer.write()
+
+
+@app.route("/api/job-status/<job_id>")
+def job_status(job_id):
+    """Get repair status for a job."""
+    if job_id not in jobs:
+        return jsonify({"error": "Job not found"}), 404
+
+    job = jobs[job_id]
+    return jsonify({
+        "job_id": job_id,
+        "status": job["status"],
+        "missing_clips": job.get("missing_clips", []),
+        "repaired_clips": job.get("repaired_clips", []),
+        "output_path": job["output_path"],
+        "hls": job.get("hls"),
+        "error": job["error"],
+    })
+
+
+@app.route("/api/key-usage")
+def key_usage():
+    """Report per-key usage for the server's API key pool."""
+    pool = get_key_pool()
+    return jsonify({"keys": pool.usage() if pool else []})
+
+
+@app.route("/api/debug/trace/<job_id>")
+def debug_trace(job_id):
+    """Serve a job's trace: Chrome trace JSON by default, or ?format=jsonl."""
+    if request.args.get("format") == "jsonl":
+        filename, mimetype = "trace.jsonl", "application/x-ndjson"
+    else:
+        filename, mimetype = "trace.json", "application/json"
+
+    return send_from_directory(OUTPUT_DIR, f"{job_id}/trace/{filename}", mimetype=mimetype)
+
+
+@app.route("/api/debug/trace/<job_id>/<filename>")
+def debug_trace_file(job_id, filename):
+    """Download another file from a job's trace directory (e.g. a cProfile dump)."""
+    return send_from_directory(OUTPUT_DIR, f"{job_id}/trace/{filename}", as_attachment=True)
+
+
+@app.route("/hls/<job_id>/<path:filename>")
+def hls_asset(job_id, filename):
+    """Serve HLS playlists and segments for a packaged job."""
+    mimetypes = {
+        ".m3u8": "application/vnd.apple.mpegurl",
+        ".ts": "video/mp2t",
+    }
+    mimetype = mimetypes.get(os.path.splitext(filename)[1])
+    if not mimetype:
+        return jsonify({"error": "Not found"}), 404
+
+    # Paths are versioned by content digest, so every file is immutable
+    response = send_from_directory(
+        OUTPUT_DIR,
+        f"{job_id}/hls/{filename}",
+        mimetype=mimetype,
+        max_age=31536000,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 if __name__ == "__main__":
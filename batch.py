@@ -0,0 +1,46 @@
+import os
+import sys
+import argparse
+from services.batch_runner import BatchRunner
+from config import OUTPUT_DIR
+
+
+def main(argv=None) -> int:
+    """Generate clips for every prompt in a JSONL file without the web UI."""
+    parser = argparse.ArgumentParser(
+        description="Bulk-generate Sora clips from a JSONL file of prompts."
+    )
+    parser.add_argument("input", help="JSONL file, one {\"prompt\": ...} object per line")
+    parser.add_argument("--manifest", help="Manifest path (default: output/<job-id>/manifest.json)")
+    parser.add_argument("--job-id", help="Output folder name (default: input file name)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clips in flight at once")
+    parser.add_argument("--model", default="sora-2", help="Default model for lines without one")
+    parser.add_argument("--duration", type=int, default=4, help="Default duration for lines without one")
+    parser.add_argument("--api-key", help="OpenAI API key (default: OPENAI_API_KEY)")
+    parser.add_argument("--retry-failed", action="store_true", help="Resubmit items that failed previously")
+    args = parser.parse_args(argv)
+
+    job_id = args.job_id or "batch_" + os.path.splitext(os.path.basename(args.input))[0]
+    manifest_path = args.manifest or os.path.join(OUTPUT_DIR, job_id, "manifest.json")
+
+    runner = BatchRunner(
+        manifest_path,
+        job_id,
+        concurrency=args.concurrency,
+        api_key=args.api_key,
+        default_model=args.model,
+        default_duration=args.duration,
+    )
+    items = runner.load(args.input)
+    print(f"Loaded {len(items)} items, manifest: {manifest_path}")
+
+    counts = runner.run(retry_failed=args.retry_failed)
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+
+    # Anything not completed (failed, or still submitted after a poll error) needs another run
+    unfinished = sum(count for status, count in counts.items() if status != BatchRunner.COMPLETED)
+    return 1 if unfinished else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Optional comma-separated pool of keys for server-initiated generations,
+# each optionally suffixed with ":<organization id>"
+OPENAI_API_KEYS = [k.strip() for k in os.getenv("OPENAI_API_KEYS", "").split(",") if k.strip()]
 
 # Video settings
 # Supported sizes: 720x1280, 1280x720, 1024x1792, 1792x1024
@@ -15,3 +18,36 @@ MIN_CLIPS = 3
 
 # Output directory
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "output")
+
+# HLS packaging (optional stage after final.mp4 is assembled)
+# Each rung: (name, width, height, video bitrate, audio bitrate).
+# A rung matching VIDEO_WIDTH x VIDEO_HEIGHT is stream-copied instead of re-encoded.
+HLS_ENABLED = os.getenv("HLS_ENABLED", "false").lower() == "true"
+HLS_SEGMENT_SECONDS = 4
+HLS_LADDER = [
+    ("720p", 720, 1280, "3000k", "128k"),
+    ("480p", 480, 854, "1400k", "96k"),
+    ("360p", 360, 640, "800k", "64k"),
+]
+HLS_MAX_WORKERS = 3
+# Base URL playlists are served from; point at a CDN/static tier to bypass Flask
+HLS_BASE_URL = os.getenv("HLS_BASE_URL", "/hls").rstrip("/")
+
+# Render latency tracking (feeds ETAs, poll timing and batch scheduling)
+LATENCY_STATS_PATH = os.path.join(OUTPUT_DIR, "latency_stats.json")
+LATENCY_WINDOW = 200  # most recent observations kept per model/duration/reference
+MAX_POLL_INTERVAL = 30  # seconds; cap on the wait before a render is expected to finish
+
+# Chunked prompt enhancement (StoryProcessor.enhance_prompts)
+ENHANCE_CHUNK_SIZE = 4  # scenes per rewrite call; 0 sends every scene in one call
+ENHANCE_MAX_WORKERS = 4
+ENHANCE_CHUNK_RETRIES = 2  # extra attempts for a chunk whose reply can't be parsed
+
+# Draft mode: fast preview render before the full-quality one
+DRAFT_MODEL = "sora-2"
+DRAFT_DURATION = 4
+
+# Opt-in tracing: span timelines written to output/<job_id>/trace/
+# (can also be enabled per request with "trace": true / "cprofile" / "tracemalloc")
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_PROFILE = os.getenv("TRACE_PROFILE", "")  # "", "cprofile" or "tracemalloc"
@@ -0,0 +1,358 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+from PIL import Image
+from services.sora_client import SoraClient
+from services.image_processor import resize_cover
+from services.latency_model import latency_model
+from config import OUTPUT_DIR, VIDEO_WIDTH, VIDEO_HEIGHT
+
+
+class BatchRunner:
+    """Run a JSONL file of prompts through Sora with a resumable manifest."""
+
+    # Item statuses, in the order an item moves through them
+    PENDING = "pending"
+    SUBMITTED = "submitted"
+    DOWNLOADING = "downloading"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        manifest_path: str,
+        job_id: str,
+        concurrency: int = 4,
+        api_key: str = None,
+        default_model: str = "sora-2",
+        default_duration: int = 4,
+    ):
+        self.manifest_path = manifest_path
+        self.job_id = job_id
+        self.concurrency = max(1, concurrency)
+        self.api_key = api_key
+        self.default_model = default_model
+        self.default_duration = default_duration
+        self.manifest = {"job_id": job_id, "items": []}
+        self._lock = threading.Lock()
+
+    def load(self, input_path: str) -> List[Dict]:
+        """
+        Load the manifest (if one exists) and merge in items from the JSONL input.
+
+        Lines are matched to manifest items by their 'id' when present, and
+        otherwise by a hash of prompt, model, duration and reference image, so
+        inserting, removing or reordering lines never moves recorded state to a
+        different prompt. Matched items keep their state, new lines are added
+        as pending, and items whose line was removed (or whose settings changed
+        under the same 'id') are set aside under 'orphaned'.
+
+        Args:
+            input_path: JSONL file, one object per line with 'prompt' and
+                optional 'id', 'duration', 'model', 'reference_image'
+
+        Returns:
+            List of manifest items, in input order
+        """
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            self.job_id = self.manifest.get("job_id", self.job_id)
+
+        known = {}
+        seen = {}
+        for item in self.manifest["items"] + self.manifest.get("orphaned", []):
+            # Manifests written before items had keys/clip numbers
+            item.setdefault("clip_number", item["index"])
+            if "item_key" not in item:
+                item["item_key"] = self._occurrence_key(self._fields_key(item), seen)
+            known[item["item_key"]] = item
+
+        next_number = max([item["clip_number"] for item in known.values()], default=0) + 1
+
+        with open(input_path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+
+        items = []
+        seen = {}
+        for index, line in enumerate(lines, start=1):
+            if not line:
+                continue
+
+            item_key = self._occurrence_key(self._line_key(line), seen)
+            item = known.pop(item_key, None)
+            if (
+                item is not None
+                and item_key.startswith("id:")
+                and self._fields_key(dict(item, id=None)) != self._line_key(line, use_id=False)
+            ):
+                # Same id, edited prompt/settings: that's a new render
+                item["item_key"] = f"{item_key}@{item['clip_number']}"
+                known[item["item_key"]] = item
+                item = None
+
+            if item is None:
+                item = self._new_item(item_key, next_number, line)
+                next_number += 1
+
+            item["index"] = index
+            items.append(item)
+
+        self.manifest["items"] = items
+        self.manifest["orphaned"] = list(known.values())
+        self._save()
+        return items
+
+    def _line_key(self, line: str, use_id: bool = True) -> str:
+        """Identity of a JSONL line: its 'id' if given (and use_id), else a hash of its settings."""
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            data = None
+
+        if not isinstance(data, dict):
+            return "line:" + hashlib.sha1(line.encode("utf-8")).hexdigest()[:16]
+
+        if use_id and data.get("id") is not None:
+            return f"id:{data['id']}"
+
+        return self._fields_key({
+            "id": None,
+            "prompt": (data.get("prompt") or "").strip(),
+            "model": data.get("model", self.default_model),
+            "duration": data.get("duration", self.default_duration),
+            "reference_image": data.get("reference_image"),
+        })
+
+    def _fields_key(self, item: Dict) -> str:
+        """Identity of a parsed item, computed the same way as _line_key."""
+        if item.get("id") is not None:
+            return f"id:{item['id']}"
+
+        fields = [item["prompt"], item["model"], item["duration"], item["reference_image"]]
+        return "sha1:" + hashlib.sha1(json.dumps(fields).encode("utf-8")).hexdigest()[:16]
+
+    def _occurrence_key(self, key: str, seen: Dict) -> str:
+        """Disambiguate identical lines by their occurrence number."""
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        return f"{key}#{count}" if count else key
+
+    def _new_item(self, item_key: str, clip_number: int, line: str) -> Dict:
+        """
+        Build a manifest item from one JSONL line.
+
+        clip_number names the item's output files and never changes, even if
+        the line later moves within the input.
+        """
+        item = {
+            "item_key": item_key,
+            "clip_number": clip_number,
+            "index": None,
+            "id": None,
+            "prompt": "",
+            "model": self.default_model,
+            "duration": self.default_duration,
+            "reference_image": None,
+            "status": self.PENDING,
+            "video_id": None,
+            "key": None,
+            "render_failed": False,
+            "video_gone": False,
+            "video_path": None,
+            "error": None,
+            "attempts": 0,
+            "updated_at": time.time(),
+        }
+
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            item["status"] = self.FAILED
+            item["error"] = f"Invalid JSON: {e}"
+            return item
+
+        if not isinstance(data, dict):
+            item["status"] = self.FAILED
+            item["error"] = "Each line must be a JSON object"
+            return item
+
+        item["id"] = data.get("id")
+        item["prompt"] = (data.get("prompt") or "").strip()
+        item["model"] = data.get("model", self.default_model)
+        item["duration"] = data.get("duration", self.default_duration)
+        item["reference_image"] = data.get("reference_image")
+
+        error = self._validation_error(item)
+        if error:
+            item["status"] = self.FAILED
+            item["error"] = error
+
+        return item
+
+    def _validation_error(self, item: Dict) -> str:
+        """Why an item can't be submitted at all, or None if it can."""
+        valid_durations = SoraClient.VALID_DURATIONS.get(item["model"], [4, 8, 12])
+        if not item["prompt"]:
+            return "No prompt provided"
+        if item["duration"] not in valid_durations:
+            return f"Duration must be one of {valid_durations} for {item['model']}"
+        return None
+
+    def run(self, retry_failed: bool = False) -> Dict:
+        """
+        Process every unfinished item with up to `concurrency` in flight.
+
+        Completed items are skipped. Submitted or downloading items resume
+        polling their existing video_id instead of being resubmitted; a
+        network error or timeout leaves an item submitted for the next run.
+        An item whose video can no longer be fetched (not found, expired, or
+        owned by no configured key) fails instead.
+
+        Args:
+            retry_failed: Also retry failed items. Only renders Sora reported
+                as failed, videos that are gone, and items never created are
+                resubmitted.
+
+        Returns:
+            Dict of item counts by status
+        """
+        todo = [item for item in self.manifest["items"] if self._needs_work(item, retry_failed)]
+        todo.sort(key=self._schedule_key)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(self._process_item, todo))
+
+        counts = {}
+        for item in self.manifest["items"]:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return counts
+
+    def _needs_work(self, item: Dict, retry_failed: bool) -> bool:
+        """Decide whether an item still has work left on this run."""
+        if item["status"] == self.COMPLETED:
+            # Only re-fetch if the downloaded file has gone missing
+            if item["video_path"] and os.path.exists(item["video_path"]):
+                return False
+            self._update(item, status=self.SUBMITTED)
+            return True
+
+        if item["status"] == self.FAILED:
+            if not retry_failed or self._validation_error(item):
+                return False
+
+            if item["video_id"] and not item.get("render_failed") and not item.get("video_gone"):
+                # The render may well have finished; poll it rather than pay for another
+                self._update(item, status=self.SUBMITTED, error=None)
+            else:
+                self._update(
+                    item, status=self.PENDING, video_id=None, key=None,
+                    render_failed=False, video_gone=False, error=None,
+                )
+
+        return True
+
+    def _schedule_key(self, item: Dict):
+        """
+        Sort key for the work queue.
+
+        Items already rendering go first since they only need polling. Pending
+        items follow longest-expected-first, so slow renders don't end up
+        running alone at the tail of the batch; items with no latency history
+        yet are treated as slowest.
+        """
+        if item["status"] != self.PENDING:
+            return (0, 0)
+
+        expected = latency_model.expected_total(
+            item["model"], item["duration"], bool(item.get("reference_image"))
+        )
+        return (1, -expected if expected is not None else float("-inf"))
+
+    def _process_item(self, item: Dict) -> None:
+        """Drive one item from its current status to completed or failed."""
+        try:
+            sora = SoraClient(
+                clip_duration=item["duration"],
+                api_key=self.api_key,
+                model=item["model"],
+            )
+            clip = {"id": item["clip_number"], "visual_prompt": item["prompt"]}
+
+            if item["status"] == self.PENDING:
+                reference_image_path = self._prepare_reference(item)
+                self._update(item, attempts=item["attempts"] + 1)
+                video_id = sora.create_video(clip, reference_image_path=reference_image_path)
+                self._update(
+                    item, status=self.SUBMITTED, video_id=video_id, key=sora.key_label(video_id)
+                )
+            elif item.get("key") and sora.key_pool:
+                # Resuming: poll with the pooled key that created the video. If
+                # that key is no longer configured, the pool looks the video up
+                sora.key_pool.pin_label(item["video_id"], item["key"])
+
+            result = sora.finish_clip(
+                item["video_id"],
+                clip,
+                self.job_id,
+                status_callback=lambda status: self._update(item, status=status),
+            )
+
+            if result["status"] == "completed":
+                self._update(item, status=self.COMPLETED, video_path=result["video_path"], error=None)
+            elif result.get("render_failed") or result.get("video_gone"):
+                self._update(
+                    item, status=self.FAILED,
+                    render_failed=result.get("render_failed", False),
+                    video_gone=result.get("video_gone", False),
+                    error=result.get("error", "Generation failed"),
+                )
+            else:
+                # Network error or timeout: keep the video_id so the next run
+                # polls it again instead of resubmitting
+                self._update(item, error=result.get("error", "Generation failed"))
+
+        except Exception as e:
+            if item["video_id"]:
+                self._update(item, error=str(e))
+            else:
+                self._update(item, status=self.FAILED, error=str(e))
+
+        print(f"[{item['index']}] {item['status']}" + (f": {item['error']}" if item["error"] else ""))
+
+    def _prepare_reference(self, item: Dict) -> str:
+        """Resize an item's reference image to the video size, if it has one."""
+        source = item.get("reference_image")
+        if not source:
+            return None
+
+        job_dir = os.path.join(OUTPUT_DIR, self.job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        reference_path = os.path.join(job_dir, f"reference_{item['clip_number']:02d}.png")
+
+        if not os.path.exists(reference_path):
+            img = resize_cover(Image.open(source), VIDEO_WIDTH, VIDEO_HEIGHT)
+            img.save(reference_path, format="PNG")
+
+        return reference_path
+
+    def _update(self, item: Dict, **changes) -> None:
+        """Apply a state transition to an item and persist the manifest."""
+        with self._lock:
+            item.update(changes)
+            item["updated_at"] = time.time()
+            self._save()
+
+    def _save(self) -> None:
+        """Atomically write the manifest so a crash never leaves it half-written."""
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,14 @@
+from PIL import Image
+
+
+def resize_cover(img: Image.Image, target_w: int, target_h: int) -> Image.Image:
+    """Resize and center-crop an image to exactly target_w x target_h."""
+    src_w, src_h = img.size
+    scale = max(target_w / src_w, target_h / src_h)
+    new_w = round(src_w * scale)
+    new_h = round(src_h * scale)
+    img = img.resize((new_w, new_h), Image.LANCZOS)
+    left = (new_w - target_w) // 2
+    top = (new_h - target_h) // 2
+    img = img.crop((left, top, left + target_w, top + target_h))
+    return img.convert("RGB")
@@ -0,0 +1,61 @@
+from typing import Dict
+from services.sora_client import SoraClient
+from services.video_processor import VideoProcessor
+from services.job_store import load_job, save_job
+from services import tracing
+
+
+def repair_job(job_id: str, api_key: str = None, package_hls: bool = None) -> Dict:
+    """
+    Regenerate a job's failed or missing clips and rebuild its final video.
+
+    Completed clip files are kept. The remaining clips are regenerated with
+    the prompts, reference images, model and duration saved in job.json,
+    then assembly re-runs, reusing final.mp4 and HLS output when unchanged.
+
+    Args:
+        job_id: Job identifier with a saved job.json
+        api_key: Optional OpenAI API key override
+        package_hls: Also segment the final video into HLS
+
+    Only jobs with a job.json can be repaired. That record is written by
+    SoraClient.generate_all_clips, so repair covers jobs generated through it
+    (the web UI's single clips and batch.py runs don't create one).
+
+    Returns:
+        Dict with status, output path, and the clip ids that were successfully
+        regenerated (clips that failed again are still in missing_clips)
+    """
+    record = load_job(job_id)
+    if not record:
+        return {"status": "failed", "error": "Job not found"}
+
+    clips = record["clips"]
+    sora = SoraClient(
+        clip_duration=record["clip_duration"],
+        api_key=api_key,
+        model=record["model"],
+    )
+
+    attempted = set()
+    with tracing.span("repair.clips"):
+        results = sora.repair_clips(
+            clips,
+            record.get("results", []),
+            job_id,
+            progress_callback=lambda current, total, clip_id: attempted.add(clip_id),
+        )
+    repaired = [
+        r["clip_id"] for r in results
+        if r["clip_id"] in attempted and r["status"] == "completed"
+    ]
+
+    with tracing.span("repair.assemble"):
+        output = VideoProcessor().process_video(results, clips, job_id, package_hls=package_hls)
+    output["repaired_clips"] = repaired
+
+    record = load_job(job_id)
+    record["output"] = output
+    save_job(job_id, record)
+
+    return output
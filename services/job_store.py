@@ -0,0 +1,30 @@
+import os
+import json
+from typing import Dict
+from config import OUTPUT_DIR
+
+
+def job_record_path(job_id: str) -> str:
+    """Path of the record describing a multi-clip job."""
+    return os.path.join(OUTPUT_DIR, job_id, "job.json")
+
+
+def save_job(job_id: str, record: Dict) -> None:
+    """Atomically write a job record to output/<job_id>/job.json."""
+    path = job_record_path(job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_job(job_id: str) -> Dict:
+    """Load a job record, or None if the job has none."""
+    path = job_record_path(job_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
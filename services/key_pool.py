@@ -0,0 +1,235 @@
+import re
+import threading
+import time
+from typing import Dict, List
+from openai import OpenAI, NotFoundError, PermissionDeniedError
+from config import OPENAI_API_KEY, OPENAI_API_KEYS
+
+
+class PooledKey:
+    """One API key (optionally scoped to an organization) and its learned limits."""
+
+    def __init__(self, api_key: str, organization: str = None):
+        self.api_key = api_key
+        self.organization = organization
+        self.client = OpenAI(api_key=api_key, organization=organization)
+        # Stable, non-secret name used in manifests and usage reports
+        self.label = f"...{api_key[-4:]}" + (f"@{organization}" if organization else "")
+
+        # Learned from x-ratelimit-* headers; None until the first response
+        self.remaining_requests = None
+        self.reset_at = 0.0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        # Creates handed out by acquire() that haven't got a response yet
+        self.pending = 0
+
+        self.usage = {"created": 0, "polls": 0, "downloads": 0, "rate_limited": 0}
+
+    def headroom(self, now: float) -> float:
+        """Requests this key can still make in its current rate-limit window."""
+        if self.remaining_requests is None or now >= self.reset_at:
+            return float("inf")
+        return self.remaining_requests - self.pending
+
+
+class KeyPool:
+    """
+    Spread video generations across several API keys or organizations.
+
+    Each new generation goes to the key with the most rate-limit headroom,
+    as reported by its last response headers. Keys that return 429 sit out
+    until their limit resets. Every video_id stays pinned to the key that
+    created it, because it can only be polled and downloaded with that key.
+    """
+
+    def __init__(self, entries: List[str]):
+        """
+        Args:
+            entries: API keys, each optionally suffixed with ':<organization id>'
+        """
+        self.keys = []
+        for entry in entries:
+            api_key, _, organization = entry.strip().partition(":")
+            if api_key:
+                self.keys.append(PooledKey(api_key, organization or None))
+
+        self._pins: Dict[str, PooledKey] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def acquire(self) -> PooledKey:
+        """
+        Pick the key with the most headroom for a new generation.
+
+        The pick is reserved until record_response, mark_rate_limited or
+        cancel settles it, so concurrent callers spread across keys instead
+        of all landing on the same one. Blocks while every key is cooling
+        down after a 429.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                available = [k for k in self.keys if k.cooldown_until <= now]
+                if available:
+                    key = max(available, key=lambda k: (k.headroom(now), -(k.in_flight + k.pending)))
+                    key.pending += 1
+                    return key
+                wait = min(k.cooldown_until for k in self.keys) - now
+
+            time.sleep(max(wait, 0.1))
+
+    def record_response(self, key: PooledKey, headers) -> None:
+        """Learn a key's remaining requests from x-ratelimit-* response headers."""
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        reset = headers.get("x-ratelimit-reset-requests")
+
+        with self._lock:
+            key.pending = max(0, key.pending - 1)
+            if remaining is not None and remaining.isdigit():
+                key.remaining_requests = int(remaining)
+            if reset:
+                key.reset_at = time.time() + _parse_reset(reset)
+
+    def mark_rate_limited(self, key: PooledKey, headers=None) -> None:
+        """Bench a key after a 429 until its limit resets."""
+        headers = headers or {}
+        retry_after = headers.get("retry-after")
+        reset = headers.get("x-ratelimit-reset-requests")
+
+        if retry_after and re.fullmatch(r"\d+(\.\d+)?", retry_after):
+            delay = float(retry_after)
+        elif reset:
+            delay = _parse_reset(reset)
+        else:
+            delay = 10.0
+
+        with self._lock:
+            key.pending = max(0, key.pending - 1)
+            key.usage["rate_limited"] += 1
+            key.remaining_requests = 0
+            key.reset_at = key.cooldown_until = time.time() + delay
+
+    def cancel(self, key: PooledKey) -> None:
+        """Drop a reservation from acquire() whose request failed without a response."""
+        with self._lock:
+            key.pending = max(0, key.pending - 1)
+
+    def pin(self, video_id: str, key: PooledKey) -> None:
+        """Record that video_id was created with key."""
+        with self._lock:
+            self._pin(video_id, key)
+            key.usage["created"] += 1
+
+    def pin_label(self, video_id: str, label: str) -> bool:
+        """Re-pin a video_id by key label (e.g. from a saved manifest)."""
+        for key in self.keys:
+            if key.label == label:
+                with self._lock:
+                    self._pin(video_id, key)
+                return True
+        return False
+
+    def _pin(self, video_id: str, key: PooledKey) -> None:
+        """Pin video_id to key, counting it in flight once (caller holds the lock)."""
+        if self._pins.get(video_id) is not key:
+            self._pins[video_id] = key
+            key.in_flight += 1
+
+    def resolve(self, video_id: str) -> PooledKey:
+        """
+        Find and pin the key that owns a video nobody pinned.
+
+        This happens for videos created in an earlier process, such as a
+        resumed manifest without a key label, or a repaired job. Each key is
+        asked for the video, and the first one that can see it wins.
+
+        Raises:
+            LookupError: if no pooled key can see the video
+        """
+        key = self.key_for(video_id)
+        if key:
+            return key
+
+        owner = None
+        if len(self.keys) == 1:
+            owner = self.keys[0]
+        else:
+            for key in self.keys:
+                try:
+                    key.client.videos.retrieve(video_id)
+                except (NotFoundError, PermissionDeniedError):
+                    continue
+                owner = key
+                break
+
+        if owner is None:
+            raise LookupError(f"Unknown key for video {video_id}: no pooled key can access it")
+
+        with self._lock:
+            self._pin(video_id, owner)
+        return owner
+
+    def key_for(self, video_id: str) -> PooledKey:
+        """The key a video was created with, or None if it isn't pinned."""
+        with self._lock:
+            return self._pins.get(video_id)
+
+    def release(self, video_id: str) -> None:
+        """Unpin a finished video so its key's in-flight count drops."""
+        with self._lock:
+            key = self._pins.pop(video_id, None)
+            if key:
+                key.in_flight = max(0, key.in_flight - 1)
+
+    def count(self, key: PooledKey, event: str) -> None:
+        """Add one to a key's usage counter for event ("polls", "downloads", ...)."""
+        with self._lock:
+            key.usage[event] += 1
+
+    def usage(self) -> List[Dict]:
+        """Per-key usage and current rate-limit state, without the secrets."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "key": k.label,
+                    "in_flight": k.in_flight,
+                    "pending": k.pending,
+                    "remaining_requests": k.remaining_requests if now < k.reset_at else None,
+                    "cooling_down": k.cooldown_until > now,
+                    **k.usage,
+                }
+                for k in self.keys
+            ]
+
+
+def _parse_reset(value: str) -> float:
+    """Parse a reset duration like '1s', '6m0s' or '250ms' into seconds."""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    total = 0.0
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value):
+        total += float(amount) * units[unit]
+    return total
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_key_pool() -> KeyPool:
+    """
+    The shared pool for server-initiated generations.
+
+    Built from OPENAI_API_KEYS, falling back to the single OPENAI_API_KEY.
+    Returns None if no key is configured.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            entries = OPENAI_API_KEYS or ([OPENAI_API_KEY] if OPENAI_API_KEY else [])
+            if entries:
+                _default_pool = KeyPool(entries)
+        return _default_pool
@@ -0,0 +1,123 @@
+import os
+import json
+import threading
+from collections import deque
+from typing import Dict, List
+from config import LATENCY_STATS_PATH, LATENCY_WINDOW
+
+
+class RollingQuantiles:
+    """Quantile estimates over the most recent `window` observations."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, samples: List[float] = None):
+        self.samples = deque(samples or [], maxlen=window)
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        """Linearly interpolated quantile, or None with no observations."""
+        if not self.samples:
+            return None
+
+        ordered = sorted(self.samples)
+        position = q * (len(ordered) - 1)
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+class LatencyModel:
+    """
+    Observed Sora latencies keyed by stage, model, duration and reference flag.
+
+    Stages are "render" (create to completed) and "download". Observations are
+    persisted to LATENCY_STATS_PATH so estimates survive restarts.
+    """
+
+    STAGES = ("render", "download")
+
+    def __init__(self, stats_path: str = LATENCY_STATS_PATH):
+        self.stats_path = stats_path
+        self._sketches: Dict[str, RollingQuantiles] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _key(self, stage: str, model: str, duration: int, has_reference: bool) -> str:
+        return f"{stage}|{model}|{duration}|{int(bool(has_reference))}"
+
+    def record(
+        self, stage: str, model: str, duration: int, has_reference: bool, seconds: float
+    ) -> None:
+        """Add one observed latency and persist the updated sketches."""
+        key = self._key(stage, model, duration, has_reference)
+        with self._lock:
+            self._sketches.setdefault(key, RollingQuantiles()).add(seconds)
+            self._save()
+
+    def quantile(
+        self, stage: str, model: str, duration: int, has_reference: bool, q: float
+    ) -> float:
+        """
+        Estimate a latency quantile in seconds, or None with no data.
+
+        Falls back to observations with the other reference flag when the
+        exact combination has not been seen yet.
+        """
+        with self._lock:
+            for flag in (has_reference, not has_reference):
+                sketch = self._sketches.get(self._key(stage, model, duration, flag))
+                if sketch:
+                    return sketch.quantile(q)
+        return None
+
+    def expected_total(
+        self, model: str, duration: int, has_reference: bool, q: float = 0.5
+    ) -> float:
+        """Expected render plus download time in seconds, or None with no data."""
+        render = self.quantile("render", model, duration, has_reference, q)
+        if render is None:
+            return None
+        download = self.quantile("download", model, duration, has_reference, q) or 0
+        return render + download
+
+    def eta(
+        self, model: str, duration: int, has_reference: bool, elapsed: float, q: float = 0.5
+    ) -> float:
+        """Estimated seconds remaining for a clip started `elapsed` seconds ago."""
+        total = self.expected_total(model, duration, has_reference, q)
+        if total is None:
+            return None
+        return max(0.0, total - elapsed)
+
+    def _load(self) -> None:
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Latency stats load error: {e}")
+            return
+
+        for key, samples in data.items():
+            self._sketches[key] = RollingQuantiles(samples=samples)
+
+    def _save(self) -> None:
+        if not self.stats_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            tmp_path = self.stats_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({key: list(s.samples) for key, s in self._sketches.items()}, f)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            print(f"Latency stats save error: {e}")
+
+
+# Shared across the app, the batch runner and every SoraClient
+latency_model = LatencyModel()
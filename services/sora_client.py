@@ -1,8 +1,12 @@
 import os
 import time
 from typing import Dict, List
-from openai import OpenAI
-from config import OPENAI_API_KEY, OUTPUT_DIR
+from openai import OpenAI, NotFoundError, RateLimitError
+from services import tracing
+from services.job_store import save_job
+from services.key_pool import KeyPool, get_key_pool
+from services.latency_model import latency_model
+from config import OPENAI_API_KEY, OUTPUT_DIR, MAX_POLL_INTERVAL
 
 
 class SoraClient:
@@ -13,14 +17,25 @@ class SoraClient:
         "sora-2-pro": [10, 15, 25],
     }
 
-    def __init__(self, clip_duration: int = 4, api_key: str = None, model: str = "sora-2"):
-        self.client = OpenAI(api_key=api_key or OPENAI_API_KEY)
+    def __init__(
+        self,
+        clip_duration: int = 4,
+        api_key: str = None,
+        model: str = "sora-2",
+        key_pool: KeyPool = None,
+    ):
+        # A caller-supplied key is used as-is; server-initiated generations
+        # are spread across the configured key pool instead
+        self.key_pool = None if api_key else (key_pool or get_key_pool())
+        self.client = None if self.key_pool else OpenAI(api_key=api_key or OPENAI_API_KEY)
         self.model = model if model in self.VALID_DURATIONS else "sora-2"
         # Vertical format for YouTube Shorts (9:16)
         # Valid sizes: 720x1280, 1280x720, 1024x1792, 1792x1024
         self.resolution = "720x1280"
         valid = self.VALID_DURATIONS[self.model]
         self.clip_duration = clip_duration if clip_duration in valid else valid[0]
+        # video_id -> has reference image, for latency tracking
+        self._submitted = {}
 
     def generate_clip(self, clip: Dict, job_id: str, reference_image_path: str = None) -> Dict:
         """
@@ -34,38 +49,154 @@ class SoraClient:
         Returns:
             Dict with clip info and video path or error
         """
+        try:
+            video_id = self.create_video(clip, reference_image_path=reference_image_path)
+        except Exception as e:
+            return {
+                "clip_id": clip["id"],
+                "status": "failed",
+                "error": str(e),
+            }
+
+        return self.finish_clip(video_id, clip, job_id)
+
+    def create_video(self, clip: Dict, reference_image_path: str = None) -> str:
+        """
+        Submit a video generation request without waiting for it.
+
+        Args:
+            clip: Dict with 'visual_prompt'
+            reference_image_path: Optional path to a reference image
+
+        Returns:
+            The Sora video_id
+        """
         full_prompt = self._create_full_prompt(clip)
 
-        try:
-            # Build API kwargs
-            create_kwargs = dict(
-                model=self.model,
-                prompt=full_prompt,
-                size=self.resolution,
-                seconds=str(self.clip_duration),  # "4", "8", or "12"
-            )
+        # Build API kwargs
+        create_kwargs = dict(
+            model=self.model,
+            prompt=full_prompt,
+            size=self.resolution,
+            seconds=str(self.clip_duration),  # "4", "8", or "12"
+        )
+
+        has_reference = bool(reference_image_path and os.path.exists(reference_image_path))
+        if not has_reference:
+            reference_image_path = None
+
+        # Start video generation
+        with tracing.span("sora.create", model=self.model, seconds=self.clip_duration,
+                          has_reference=has_reference):
+            if self.key_pool:
+                video_id = self._create_pooled(create_kwargs, reference_image_path)
+            else:
+                video_id = self._submit(self.client.videos.create, create_kwargs, reference_image_path).id
 
-            # Attach reference image if provided
-            ref_file = None
-            if reference_image_path and os.path.exists(reference_image_path):
-                ref_file = open(reference_image_path, "rb")
-                create_kwargs["input_reference"] = ref_file
+        self._submitted[video_id] = has_reference
+        return video_id
 
-            # Start video generation
+    def _submit(self, create, create_kwargs: Dict, reference_image_path: str = None):
+        """Call a videos.create variant, attaching the reference image if provided."""
+        ref_file = None
+        if reference_image_path:
+            ref_file = open(reference_image_path, "rb")
+            create_kwargs = dict(create_kwargs, input_reference=ref_file)
+
+        try:
+            return create(**create_kwargs)
+        finally:
+            if ref_file:
+                ref_file.close()
+
+    def _create_pooled(self, create_kwargs: Dict, reference_image_path: str = None) -> str:
+        """Create a video on the pooled key with the most headroom, moving on after 429s."""
+        last_error = None
+
+        # Give each key a couple of chances before surfacing the rate limit
+        for _ in range(len(self.key_pool) * 2):
+            key = self.key_pool.acquire()
             try:
-                response = self.client.videos.create(**create_kwargs)
-            finally:
-                if ref_file:
-                    ref_file.close()
+                raw = self._submit(
+                    key.client.videos.with_raw_response.create, create_kwargs, reference_image_path
+                )
+            except RateLimitError as e:
+                self.key_pool.mark_rate_limited(key, e.response.headers)
+                last_error = e
+                continue
+            except Exception:
+                self.key_pool.cancel(key)
+                raise
+
+            self.key_pool.record_response(key, raw.headers)
+            response = raw.parse()
+            self.key_pool.pin(response.id, key)
+            return response.id
+
+        raise last_error
+
+    def _client_for(self, video_id: str, event: str = None):
+        """
+        The OpenAI client a video must be polled and downloaded with.
+
+        With a key pool this is the key that created the video, counting the
+        call against that key's usage. Videos this process didn't create are
+        looked up across the pool (LookupError if no key owns them).
+        """
+        if not self.key_pool:
+            return self.client
+
+        key = self.key_pool.resolve(video_id)
+        if event:
+            self.key_pool.count(key, event)
+        return key.client
 
-            video_id = response.id
+    def key_label(self, video_id: str) -> str:
+        """Label of the pooled key a video was created with, or None."""
+        key = self.key_pool.key_for(video_id) if self.key_pool else None
+        return key.label if key else None
 
+    def finish_clip(
+        self, video_id: str, clip: Dict, job_id: str, status_callback=None
+    ) -> Dict:
+        """
+        Wait for a submitted video and download it.
+
+        Args:
+            video_id: The Sora video_id returned by create_video
+            clip: Dict with 'id'
+            job_id: Unique job identifier for organizing output
+            status_callback: Optional callback, called with "downloading"
+                once the render is complete
+
+        Returns:
+            Dict with clip info and video path or error. Failures carry
+            'render_failed': True when Sora reported the render as failed,
+            and 'video_gone': True when the video can no longer be fetched
+            (not found, expired, or owned by no configured key); both need a
+            new render. Otherwise (network errors, timeout) the video_id may
+            still complete and can be finished again later.
+        """
+        submitted_here = video_id in self._submitted
+        has_reference = self._submitted.pop(video_id, False)
+
+        try:
             # Poll for completion
-            result = self._wait_for_completion(video_id)
+            result = self._wait_for_completion(video_id, has_reference=has_reference)
 
             if result["status"] == "completed":
+                # Only record renders this client submitted, where has_reference is known.
+                # Sora's own timestamps keep samples independent of the poll schedule.
+                if submitted_here and result.get("render_seconds") is not None:
+                    self._record_latency("render", has_reference, result["render_seconds"])
+
+                if status_callback:
+                    status_callback("downloading")
+
                 # Download the video using the API
+                download_start = time.time()
                 video_path = self._download_video(video_id, job_id, clip["id"])
+                self._record_latency("download", has_reference, time.time() - download_start)
                 return {
                     "clip_id": clip["id"],
                     "status": "completed",
@@ -78,6 +209,8 @@ class SoraClient:
                     "status": "failed",
                     "error": result.get("error", "Generation failed"),
                     "video_id": video_id,
+                    "render_failed": result.get("render_failed", False),
+                    "video_gone": result.get("video_gone", False),
                 }
 
         except Exception as e:
@@ -85,16 +218,42 @@ class SoraClient:
                 "clip_id": clip["id"],
                 "status": "failed",
                 "error": str(e),
+                "video_id": video_id,
+                "render_failed": False,
+                # e.g. the download 404s because the video was deleted
+                "video_gone": isinstance(e, (NotFoundError, LookupError)),
             }
 
+        finally:
+            if self.key_pool:
+                self.key_pool.release(video_id)
+
     def _create_full_prompt(self, clip: Dict) -> str:
         """Create a full prompt from the visual description."""
         visual = clip.get("visual_prompt", "")
         # Just use visual prompt - no narration, let Sora generate natural ambient sounds
         return visual
 
+    def _record_latency(self, stage: str, has_reference: bool, seconds: float) -> None:
+        latency_model.record(stage, self.model, self.clip_duration, has_reference, seconds)
+
+    def _poll_delay(self, elapsed: float, poll_interval: int, has_reference: bool) -> float:
+        """
+        Seconds to wait before the next status poll.
+
+        Until the fastest renders seen so far (10th percentile) would finish,
+        there is little point polling every few seconds, so wait longer,
+        capped at MAX_POLL_INTERVAL.
+        """
+        earliest = latency_model.quantile(
+            "render", self.model, self.clip_duration, has_reference, 0.1
+        )
+        if earliest is None or elapsed >= earliest:
+            return poll_interval
+        return max(poll_interval, min(earliest - elapsed, MAX_POLL_INTERVAL))
+
     def _wait_for_completion(
-        self, video_id: str, timeout: int = 600, poll_interval: int = 5
+        self, video_id: str, timeout: int = 600, poll_interval: int = 5, has_reference: bool = False
     ) -> Dict:
         """
         Poll for video generation completion.
@@ -102,27 +261,60 @@ class SoraClient:
         Args:
             video_id: The video generation ID
             timeout: Maximum wait time in seconds
-            poll_interval: Time between polls in seconds
+            poll_interval: Time between polls in seconds once a render may be done
+            has_reference: Whether the render used a reference image
 
         Returns:
             Dict with status and video_id
         """
+        with tracing.span("sora.wait", video_id=video_id) as span_args:
+            result = self._poll_until_done(video_id, timeout, poll_interval, has_reference)
+            span_args["status"] = result["status"]
+        return result
+
+    def _poll_until_done(
+        self, video_id: str, timeout: int, poll_interval: int, has_reference: bool
+    ) -> Dict:
+        """Polling loop behind _wait_for_completion."""
         start_time = time.time()
 
         while time.time() - start_time < timeout:
             try:
-                video = self.client.videos.retrieve(video_id)
+                with tracing.span("sora.poll"):
+                    video = self._client_for(video_id, "polls").videos.retrieve(video_id)
 
                 if video.status == "completed":
-                    return {"status": "completed", "video_id": video_id}
+                    if video.expires_at and video.expires_at <= time.time():
+                        return {
+                            "status": "failed",
+                            "error": f"Video {video_id} expired and can no longer be downloaded",
+                            "video_gone": True,
+                        }
+                    render_seconds = None
+                    if video.completed_at and video.created_at:
+                        render_seconds = video.completed_at - video.created_at
+                    return {"status": "completed", "video_id": video_id, "render_seconds": render_seconds}
 
                 elif video.status == "failed":
                     error_msg = video.error if video.error else "Unknown error"
-                    return {"status": "failed", "error": str(error_msg)}
+                    # The render itself failed; the video_id is spent
+                    return {"status": "failed", "error": str(error_msg), "render_failed": True}
 
                 # Still processing, wait and retry
+                elapsed = time.time() - start_time
+                time.sleep(self._poll_delay(elapsed, poll_interval, has_reference))
+
+            except RateLimitError as e:
+                # Polling is cheap to retry; back off instead of failing the clip
+                key = self.key_pool.key_for(video_id) if self.key_pool else None
+                if key:
+                    self.key_pool.mark_rate_limited(key, e.response.headers)
                 time.sleep(poll_interval)
 
+            except (NotFoundError, LookupError) as e:
+                # Deleted, expired, or no configured key owns it: polling again won't help
+                return {"status": "failed", "error": str(e), "video_gone": True}
+
             except Exception as e:
                 return {"status": "failed", "error": str(e)}
 
@@ -137,8 +329,10 @@ class SoraClient:
         # Download video content via API
         video_path = os.path.join(job_dir, f"clip_{clip_id:02d}.mp4")
 
-        content = self.client.videos.download_content(video_id)
-        content.write_to_file(video_path)
+        with tracing.span("sora.download", video_id=video_id):
+            content = self._client_for(video_id, "downloads").videos.download_content(video_id)
+        with tracing.span("sora.download_write", path=video_path):
+            content.write_to_file(video_path)
 
         return video_path
 
@@ -148,8 +342,11 @@ class SoraClient:
         """
         Generate all clips for a video.
 
+        The job's settings, clips and results are saved to job.json as each
+        clip finishes, so a partially failed job can be repaired later.
+
         Args:
-            clips: List of clip dictionaries
+            clips: List of clip dictionaries (optionally with 'reference_image_path')
             job_id: Unique job identifier
             progress_callback: Optional callback for progress updates
 
@@ -157,12 +354,71 @@ class SoraClient:
             List of results for each clip
         """
         results = []
+        self._save_job_record(job_id, clips, results)
 
         for i, clip in enumerate(clips):
             if progress_callback:
                 progress_callback(i + 1, len(clips), clip["id"])
 
-            result = self.generate_clip(clip, job_id)
+            result = self.generate_clip(
+                clip, job_id, reference_image_path=clip.get("reference_image_path")
+            )
             results.append(result)
+            self._save_job_record(job_id, clips, results)
 
         return results
+
+    def repair_clips(
+        self, clips: List[Dict], clip_results: List[Dict], job_id: str, progress_callback=None
+    ) -> List[Dict]:
+        """
+        Regenerate only the clips that failed or whose files are missing.
+
+        Completed clips with a file on disk are kept as-is; every other clip
+        is regenerated with its original prompt and reference image.
+
+        Args:
+            clips: Original clip dictionaries for the job
+            clip_results: Previous results (may be partial)
+            job_id: Unique job identifier
+            progress_callback: Optional callback for progress updates
+
+        Returns:
+            List of results for each clip, in clip order
+        """
+        previous = {r["clip_id"]: r for r in clip_results}
+        to_repair = [
+            clip for clip in clips
+            if not self._is_clip_intact(previous.get(clip["id"]))
+        ]
+
+        results = {clip["id"]: previous.get(clip["id"]) for clip in clips}
+        for i, clip in enumerate(to_repair):
+            if progress_callback:
+                progress_callback(i + 1, len(to_repair), clip["id"])
+
+            results[clip["id"]] = self.generate_clip(
+                clip, job_id, reference_image_path=clip.get("reference_image_path")
+            )
+            self._save_job_record(job_id, clips, [r for r in results.values() if r])
+
+        return [results[clip["id"]] for clip in clips]
+
+    def _is_clip_intact(self, result: Dict) -> bool:
+        """Whether a previous clip result completed and its file still exists."""
+        return bool(
+            result
+            and result["status"] == "completed"
+            and result.get("video_path")
+            and os.path.exists(result["video_path"])
+        )
+
+    def _save_job_record(self, job_id: str, clips: List[Dict], results: List[Dict]) -> None:
+        """Persist the settings, clips and results needed to repair a job."""
+        save_job(job_id, {
+            "job_id": job_id,
+            "model": self.model,
+            "clip_duration": self.clip_duration,
+            "clips": clips,
+            "results": results,
+        })
@@ -1,7 +1,14 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from typing import List, Dict
-from config import OPENAI_API_KEY
+from services import tracing
+from config import (
+    OPENAI_API_KEY,
+    ENHANCE_CHUNK_SIZE,
+    ENHANCE_MAX_WORKERS,
+    ENHANCE_CHUNK_RETRIES,
+)
 
 
 class StoryProcessor:
@@ -57,16 +64,7 @@ Break this into {clip_count} sequential scenes and write a detailed Sora-optimiz
                 temperature=0.7,
             )
 
-            content = response.choices[0].message.content.strip()
-
-            # Handle markdown code blocks if present
-            if "```" in content:
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            prompts = json.loads(content)
+            prompts = self._parse_json_response(response)
 
             # Ensure we got the right count
             if len(prompts) < clip_count:
@@ -79,17 +77,44 @@ Break this into {clip_count} sequential scenes and write a detailed Sora-optimiz
         except Exception as e:
             raise Exception(f"Failed to generate prompts: {e}")
 
-    def enhance_prompts(self, clips: List[Dict], global_style: str = "") -> List[Dict]:
+    def _parse_json_response(self, response):
+        """Parse JSON from a chat completion, tolerating markdown code fences."""
+        content = response.choices[0].message.content.strip()
+
+        # Handle markdown code blocks if present
+        if "```" in content:
+            content = content.split("```")[1]
+            if content.startswith("json"):
+                content = content[4:]
+            content = content.strip()
+
+        return json.loads(content)
+
+    def enhance_prompts(
+        self, clips: List[Dict], global_style: str = "", chunk_size: int = None
+    ) -> List[Dict]:
         """
         Enhance clip prompts with consistent character/setting descriptions.
 
+        Scripts longer than one chunk use a two-phase mode: a single call
+        extracts a style bible, then chunks of scenes are rewritten in
+        parallel against it. See _enhance_prompts_chunked.
+
         Args:
             clips: List of clip dicts with 'visual_prompt'
             global_style: Global style to apply
+            chunk_size: Scenes per rewrite call (defaults to ENHANCE_CHUNK_SIZE;
+                0 sends every scene in a single call)
 
         Returns:
             Updated clips with enhanced prompts
         """
+        if chunk_size is None:
+            chunk_size = ENHANCE_CHUNK_SIZE
+
+        if chunk_size and len(clips) > chunk_size:
+            return self._enhance_prompts_chunked(clips, global_style, chunk_size)
+
         # Gather all scene descriptions
         scenes = [clip.get("visual_prompt", "") for clip in clips]
         scenes_text = "\n".join([f"Clip {i+1}: {s}" for i, s in enumerate(scenes)])
@@ -125,17 +150,7 @@ Rewrite each scene with consistent character and setting descriptions. Return as
             )
 
             # Parse the response
-            content = response.choices[0].message.content.strip()
-
-            # Extract JSON array from response
-            # Handle markdown code blocks if present
-            if "```" in content:
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            enhanced_prompts = json.loads(content)
+            enhanced_prompts = self._parse_json_response(response)
 
             # Update clips with enhanced prompts
             for i, clip in enumerate(clips):
@@ -148,3 +163,150 @@ Rewrite each scene with consistent character and setting descriptions. Return as
             print(f"Story processing error: {e}")
             # Return original clips if enhancement fails
             return clips
+
+    def _enhance_prompts_chunked(
+        self, clips: List[Dict], global_style: str, chunk_size: int
+    ) -> List[Dict]:
+        """
+        Two-phase enhancement for long scripts.
+
+        Each chunk shares the same style bible, so characters and settings
+        stay consistent without every scene going through one large call. A
+        chunk whose reply can't be parsed is retried on its own, and keeps its
+        original prompts if it still fails. The other chunks are unaffected.
+        """
+        scenes = [clip.get("visual_prompt", "") for clip in clips]
+        style = global_style if global_style else "Cinematic, high quality"
+        bible = self.extract_style_bible(scenes, style)
+
+        chunks = [
+            (start, scenes[start:start + chunk_size])
+            for start in range(0, len(scenes), chunk_size)
+        ]
+
+        workers = max(1, min(ENHANCE_MAX_WORKERS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            rewritten = list(pool.map(
+                tracing.propagate(lambda chunk: self._rewrite_chunk_with_retries(
+                    bible, style, chunk[0], chunk[1], len(scenes)
+                )),
+                chunks,
+            ))
+
+        # pool.map keeps chunk order, so flattening restores scene order
+        enhanced_prompts = [prompt for chunk in rewritten for prompt in chunk]
+        for clip, prompt in zip(clips, enhanced_prompts):
+            clip["visual_prompt"] = prompt
+
+        return clips
+
+    def extract_style_bible(self, scenes: List[str], global_style: str = "") -> Dict:
+        """
+        Extract a compact style bible shared by every scene rewrite.
+
+        Args:
+            scenes: All scene descriptions, in order
+            global_style: Global style to apply
+
+        Returns:
+            Dict with 'characters', 'setting', 'palette' and 'style'; falls
+            back to just the global style if extraction fails
+        """
+        scenes_text = "\n".join([f"Clip {i+1}: {s}" for i, s in enumerate(scenes)])
+
+        system_prompt = """You are a video production assistant. Read every scene of a short video and write a compact style bible that all scenes will share.
+
+Include:
+1. characters: a FIXED detailed description for each recurring character/subject (appearance, clothing, features)
+2. setting: a FIXED detailed description of the location(s), lighting, time of day and weather
+3. palette: the color palette and textures
+4. style: the overall visual style and mood
+
+Keep it concise - it will be pasted into every scene rewrite.
+
+Output format - return ONLY a JSON object:
+{"characters": "...", "setting": "...", "palette": "...", "style": "..."}"""
+
+        user_prompt = f"""Global style: {global_style}
+
+Scene descriptions:
+{scenes_text}
+
+Write the style bible. Return as a JSON object."""
+
+        for attempt in range(ENHANCE_CHUNK_RETRIES + 1):
+            try:
+                with tracing.span("openai.style_bible", attempt=attempt + 1):
+                    response = self.client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=0.3,
+                    )
+
+                bible = self._parse_json_response(response)
+                if isinstance(bible, dict):
+                    return bible
+
+            except Exception as e:
+                print(f"Style bible error (attempt {attempt + 1}): {e}")
+
+        return {"style": global_style}
+
+    def _rewrite_chunk_with_retries(
+        self, bible: Dict, global_style: str, start: int, scenes: List[str], total: int
+    ) -> List[str]:
+        """Rewrite one chunk, retrying on its own; original scenes if it keeps failing."""
+        for attempt in range(ENHANCE_CHUNK_RETRIES + 1):
+            try:
+                return self._rewrite_chunk(bible, global_style, start, scenes, total)
+            except Exception as e:
+                print(f"Story processing error (clips {start + 1}-{start + len(scenes)}, "
+                      f"attempt {attempt + 1}): {e}")
+
+        return scenes
+
+    def _rewrite_chunk(
+        self, bible: Dict, global_style: str, start: int, scenes: List[str], total: int
+    ) -> List[str]:
+        """Rewrite one chunk of scenes against the style bible."""
+        bible_text = "\n".join([f"{key.capitalize()}: {value}" for key, value in bible.items()])
+        scenes_text = "\n".join(
+            [f"Clip {start + i + 1}: {s}" for i, s in enumerate(scenes)]
+        )
+
+        system_prompt = """You are a video production assistant. Your job is to rewrite scene descriptions to maintain visual consistency across all clips in a short video.
+
+You are given a style bible shared by every clip in the video. Rewrite each scene so it describes the characters, setting, palette and style EXACTLY as the style bible does, so AI video generation produces consistent visuals.
+
+Output format - return ONLY a JSON array of strings, one enhanced prompt per clip, in the order given:
+["enhanced prompt 1", "enhanced prompt 2", ...]"""
+
+        user_prompt = f"""Global style: {global_style}
+
+Style bible:
+{bible_text}
+
+Scene descriptions (clips {start + 1}-{start + len(scenes)} of {total}):
+{scenes_text}
+
+Rewrite each of these {len(scenes)} scenes using the style bible. Return as JSON array of {len(scenes)} strings."""
+
+        with tracing.span("openai.rewrite_chunk", first_clip=start + 1, clips=len(scenes)):
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0.7,
+            )
+
+        enhanced_prompts = self._parse_json_response(response)
+
+        if not isinstance(enhanced_prompts, list) or len(enhanced_prompts) != len(scenes):
+            raise ValueError(f"Expected {len(scenes)} prompts, got {enhanced_prompts!r:.200}")
+
+        return [str(prompt) for prompt in enhanced_prompts]
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List
+
+# The tracer for the job the current thread is working on (if any)
+_local = threading.local()
+
+# tracemalloc is process-wide: it runs while any tracemalloc span is open
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_spans = 0
+_tracemalloc_started = False
+
+
+class Tracer:
+    """
+    Record a span timeline for one job and write it under the job directory.
+
+    Spans are written as trace/trace.jsonl (one span per line) and
+    trace/trace.json (Chrome trace format, for chrome://tracing or Perfetto).
+    With profile set to "cprofile" or "tracemalloc", spans opened with
+    profile=True also capture a cProfile dump or allocation peak.
+    """
+
+    PROFILE_MODES = ("cprofile", "tracemalloc")
+
+    def __init__(self, job_id: str, job_dir: str, profile: str = None):
+        self.job_id = job_id
+        self.trace_dir = os.path.join(job_dir, "trace")
+        self.profile = profile if profile in self.PROFILE_MODES else None
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+        self._profile_count = 0
+
+    def record(self, name: str, start: float, end: float, **args) -> None:
+        """Add a span that was timed elsewhere (start/end are time.time() values)."""
+        thread = threading.current_thread()
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start": start,
+                "duration": end - start,
+                "thread": thread.name,
+                "thread_id": thread.ident,
+                "args": args,
+            })
+
+    @contextmanager
+    def span(self, name: str, profile: bool = False, **args):
+        """Time a block as a span; profile=True marks a CPU-bound stage worth profiling."""
+        profiler = None
+        if profile and self.profile == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active on this thread
+                profiler = None
+        elif profile and self.profile == "tracemalloc":
+            baseline = _start_tracemalloc()
+
+        start = time.time()
+        try:
+            yield args
+        except Exception as e:
+            args["error"] = str(e)
+            raise
+        finally:
+            end = time.time()
+
+            if profiler:
+                profiler.disable()
+                args["profile"] = self._dump_profile(name, profiler)
+            elif profile and self.profile == "tracemalloc":
+                # Process-wide, so concurrent spans inflate each other's peaks
+                args["alloc_peak_bytes"] = _stop_tracemalloc() - baseline
+
+            self.record(name, start, end, **args)
+
+    def _dump_profile(self, name: str, profiler: cProfile.Profile) -> str:
+        """Save cProfile stats next to the trace; returns the file name."""
+        os.makedirs(self.trace_dir, exist_ok=True)
+        with self._lock:
+            self._profile_count += 1
+            filename = f"profile_{name}_{self._profile_count:02d}.prof"
+        profiler.dump_stats(os.path.join(self.trace_dir, filename))
+        return filename
+
+    def write(self) -> None:
+        """Write the spans so far as JSONL and as a Chrome trace."""
+        os.makedirs(self.trace_dir, exist_ok=True)
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+
+        with open(os.path.join(self.trace_dir, "trace.jsonl"), "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span) + "\n")
+
+        with open(os.path.join(self.trace_dir, "trace.json"), "w", encoding="utf-8") as f:
+            json.dump(self._chrome_trace(spans), f)
+
+    def _chrome_trace(self, spans: List[Dict]) -> Dict:
+        """Convert spans to Chrome trace events (complete events, microseconds)."""
+        origin = spans[0]["start"] if spans else 0
+        thread_ids = {}
+        events = []
+
+        for span in spans:
+            tid = thread_ids.setdefault(span["thread_id"], len(thread_ids) + 1)
+            events.append({
+                "name": span["name"],
+                "cat": span["name"].split(".")[0],
+                "ph": "X",
+                "ts": round((span["start"] - origin) * 1_000_000),
+                "dur": round(span["duration"] * 1_000_000),
+                "pid": 1,
+                "tid": tid,
+                "args": span["args"],
+            })
+
+        names = {s["thread_id"]: s["thread"] for s in spans}
+        for thread_id, tid in thread_ids.items():
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                "args": {"name": names[thread_id]},
+            })
+
+        return {"traceEvents": events, "otherData": {"job_id": self.job_id}}
+
+
+def _start_tracemalloc() -> int:
+    """Open a tracemalloc span, starting tracing for the first one; returns current traced bytes."""
+    global _tracemalloc_spans, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_spans == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_started = True
+        _tracemalloc_spans += 1
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracemalloc() -> int:
+    """Close a tracemalloc span, stopping tracing after the last one; returns peak traced bytes."""
+    global _tracemalloc_spans, _tracemalloc_started
+    with _tracemalloc_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracemalloc_spans -= 1
+        if _tracemalloc_spans == 0 and _tracemalloc_started:
+            # Leave tracing alone if something else had already started it
+            tracemalloc.stop()
+            _tracemalloc_started = False
+        return peak
+
+
+def current() -> Tracer:
+    """The tracer active on this thread, or None when tracing is off."""
+    return getattr(_local, "tracer", None)
+
+
+@contextmanager
+def activate(tracer: Tracer):
+    """Make tracer the active one for this thread (None leaves tracing off)."""
+    previous = current()
+    _local.tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _local.tracer = previous
+
+
+@contextmanager
+def span(name: str, profile: bool = False, **args):
+    """Record a span on the active tracer; a no-op when tracing is off."""
+    tracer = current()
+    if tracer is None:
+        yield args
+        return
+
+    with tracer.span(name, profile=profile, **args) as span_args:
+        yield span_args
+
+
+def propagate(fn):
+    """Wrap fn so it runs under this thread's tracer, for handing to worker threads."""
+    tracer = current()
+
+    def wrapper(*args, **kwargs):
+        with activate(tracer):
+            return fn(*args, **kwargs)
+
+    return wrapper
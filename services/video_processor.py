@@ -1,8 +1,23 @@
 import os
+import re
+import json
+import hashlib
 import subprocess
 import tempfile
-from typing import List, Dict
-from config import OUTPUT_DIR, CLIP_DURATION
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple
+from services import tracing
+from config import (
+    OUTPUT_DIR,
+    CLIP_DURATION,
+    VIDEO_WIDTH,
+    VIDEO_HEIGHT,
+    HLS_ENABLED,
+    HLS_SEGMENT_SECONDS,
+    HLS_LADDER,
+    HLS_MAX_WORKERS,
+    HLS_BASE_URL,
+)
 
 
 class VideoProcessor:
@@ -11,6 +26,8 @@ class VideoProcessor:
     def __init__(self):
         # Use explicit path for FFmpeg (winget install location)
         self.ffmpeg_path = r"C:\Users\yasha\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-full_build\bin\ffmpeg.exe"
+        # ffprobe ships alongside ffmpeg
+        self.ffprobe_path = re.sub(r"ffmpeg(\.exe)?$", r"ffprobe\1", self.ffmpeg_path)
 
     def concatenate_clips(self, clip_paths: List[str], output_path: str) -> bool:
         """
@@ -44,9 +61,10 @@ class VideoProcessor:
                 output_path,
             ]
 
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, check=True
-            )
+            with tracing.span("ffmpeg.concat", clips=len(clip_paths)):
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, check=True
+                )
             return True
 
         except subprocess.CalledProcessError as e:
@@ -176,8 +194,242 @@ class VideoProcessor:
 
         return "\n".join(lines)
 
+    def package_hls(self, video_path: str, job_id: str) -> Dict:
+        """
+        Segment a video into HLS renditions following HLS_LADDER.
+
+        Output lives under output/<job_id>/hls/<version>/, where version is a
+        digest of the source video, so every playlist and segment URL is
+        immutable and safe to cache on a CDN. Re-packaging an unchanged video
+        reuses the existing renditions.
+
+        Args:
+            video_path: Path to the assembled video
+            job_id: Job identifier
+
+        Returns:
+            Dict with status, master playlist path and URL, or error
+        """
+        version = self._file_digest(video_path)
+        hls_dir = os.path.join(OUTPUT_DIR, job_id, "hls", version)
+        master_path = os.path.join(hls_dir, "master.m3u8")
+        result = {
+            "status": "completed",
+            "master_path": master_path,
+            "hls_url": f"{HLS_BASE_URL}/{job_id}/{version}/master.m3u8",
+        }
+
+        # The master playlist is only written once every rung is complete,
+        # so its presence means the whole ladder for this version is built
+        if os.path.exists(master_path):
+            return result
+
+        os.makedirs(hls_dir, exist_ok=True)
+
+        # Rungs finished by an earlier attempt are kept; only missing ones are retried
+        missing = [rung for rung in HLS_LADDER if not self._is_rendition_complete(hls_dir, rung[0])]
+
+        if missing:
+            copy_ok = self._keyframes_aligned(video_path)
+
+            # Renditions are independent ffmpeg processes, so run them in parallel
+            workers = max(1, min(HLS_MAX_WORKERS, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                packaged = list(pool.map(
+                    tracing.propagate(
+                        lambda rung: self._package_rendition(video_path, hls_dir, rung, copy_ok)
+                    ),
+                    missing,
+                ))
+
+            failed = [rung[0] for rung, ok in zip(missing, packaged) if not ok]
+            if failed:
+                return {
+                    "status": "failed",
+                    "error": f"Failed to package HLS renditions: {', '.join(failed)}",
+                }
+
+        self._write_master_playlist(master_path, hls_dir, HLS_LADDER)
+        return result
+
+    def _is_rendition_complete(self, hls_dir: str, name: str) -> bool:
+        """Whether a rendition's VOD playlist was fully written (has ENDLIST)."""
+        playlist = os.path.join(hls_dir, name, "index.m3u8")
+        if not os.path.exists(playlist):
+            return False
+        with open(playlist, "r", encoding="utf-8") as f:
+            return "#EXT-X-ENDLIST" in f.read()
+
+    def _keyframes_aligned(self, video_path: str, tolerance: float = 0.05) -> bool:
+        """
+        Whether the source has a keyframe on every HLS segment boundary.
+
+        A stream-copied rung keeps the source keyframes, so it only lines up
+        with the re-encoded rungs (which force keyframes every
+        HLS_SEGMENT_SECONDS) when the source already does.
+        """
+        try:
+            probe = subprocess.run(
+                [
+                    self.ffprobe_path, "-v", "error",
+                    "-select_streams", "v:0",
+                    "-skip_frame", "nokey",
+                    "-show_entries", "frame=pts_time:format=duration",
+                    "-of", "json",
+                    video_path,
+                ],
+                capture_output=True, text=True, check=True,
+            )
+            data = json.loads(probe.stdout)
+            duration = float(data["format"]["duration"])
+            keyframes = [float(f["pts_time"]) for f in data.get("frames", []) if "pts_time" in f]
+        except (OSError, subprocess.CalledProcessError, ValueError, KeyError) as e:
+            print(f"FFprobe keyframe check failed, re-encoding all rungs: {e}")
+            return False
+
+        boundary = 0.0
+        while boundary < duration - tolerance:
+            if not any(abs(k - boundary) <= tolerance for k in keyframes):
+                return False
+            boundary += HLS_SEGMENT_SECONDS
+        return True
+
+    def _package_rendition(
+        self, video_path: str, hls_dir: str, rung: Tuple, copy_ok: bool = False
+    ) -> bool:
+        """Encode (or stream-copy, if copy_ok) one ladder rung into an HLS playlist."""
+        name, width, height, video_bitrate, audio_bitrate = rung
+        rendition_dir = os.path.join(hls_dir, name)
+        os.makedirs(rendition_dir, exist_ok=True)
+
+        hls_args = [
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_filename", os.path.join(rendition_dir, "seg_%03d.ts"),
+            os.path.join(rendition_dir, "index.m3u8"),
+        ]
+
+        encode_args = [
+            "-vf", f"scale={width}:{height}",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-b:v", video_bitrate,
+            "-maxrate", video_bitrate,
+            "-bufsize", video_bitrate,
+            # Keyframe on every segment boundary so renditions switch cleanly
+            "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            "-c:a", "aac",
+            "-b:a", audio_bitrate,
+        ]
+
+        attempts = [encode_args]
+        if copy_ok and (width, height) == (VIDEO_WIDTH, VIDEO_HEIGHT):
+            # Source resolution and keyframes already match: try a stream copy first
+            attempts.insert(0, ["-c", "copy"])
+
+        for codec_args in attempts:
+            cmd = [self.ffmpeg_path, "-y", "-i", video_path] + codec_args + hls_args
+            try:
+                with tracing.span("ffmpeg.hls", rendition=name, copy=codec_args == ["-c", "copy"]):
+                    subprocess.run(cmd, capture_output=True, text=True, check=True)
+                return True
+            except subprocess.CalledProcessError as e:
+                print(f"FFmpeg HLS error ({name}): {e.stderr}")
+
+        return False
+
+    def _write_master_playlist(self, master_path: str, hls_dir: str, rungs: List[Tuple]) -> None:
+        """Write the HLS master playlist listing the packaged renditions."""
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for name, width, height, video_bitrate, audio_bitrate in rungs:
+            # Advertise what was actually packaged (a copied rung runs at the
+            # source bitrate); fall back to the ladder's nominal rates
+            measured = self._measure_bitrates(os.path.join(hls_dir, name))
+            if measured:
+                peak, average = measured
+                attrs = f"BANDWIDTH={peak},AVERAGE-BANDWIDTH={average}"
+            else:
+                bandwidth = self._parse_bitrate(video_bitrate) + self._parse_bitrate(audio_bitrate)
+                attrs = f"BANDWIDTH={bandwidth}"
+            lines.append(f"#EXT-X-STREAM-INF:{attrs},RESOLUTION={width}x{height}")
+            lines.append(f"{name}/index.m3u8")
+
+        tmp_path = master_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, master_path)
+
+    def _measure_bitrates(self, rendition_dir: str) -> Tuple[int, int]:
+        """
+        Peak and average bitrate of a packaged rendition, from its segment sizes.
+
+        Returns None if the playlist can't be read.
+        """
+        playlist = os.path.join(rendition_dir, "index.m3u8")
+        peak = 0
+        total_bits = 0
+        total_seconds = 0.0
+        try:
+            with open(playlist, "r", encoding="utf-8") as f:
+                segment_seconds = None
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("#EXTINF:"):
+                        segment_seconds = float(line[len("#EXTINF:"):].split(",")[0])
+                    elif line and not line.startswith("#") and segment_seconds:
+                        bits = os.path.getsize(os.path.join(rendition_dir, line)) * 8
+                        peak = max(peak, round(bits / segment_seconds))
+                        total_bits += bits
+                        total_seconds += segment_seconds
+                        segment_seconds = None
+        except (OSError, ValueError):
+            return None
+
+        if not total_seconds:
+            return None
+        return peak, round(total_bits / total_seconds)
+
+    def _parse_bitrate(self, bitrate: str) -> int:
+        """Convert an ffmpeg bitrate string like '1400k' to bits per second."""
+        multipliers = {"k": 1_000, "m": 1_000_000}
+        suffix = bitrate[-1].lower()
+        if suffix in multipliers:
+            return int(float(bitrate[:-1]) * multipliers[suffix])
+        return int(bitrate)
+
+    def _inputs_fingerprint(self, paths: List[str]) -> str:
+        """Fingerprint a list of input files by path, size and modification time."""
+        digest = hashlib.sha1()
+        for path in paths:
+            stat = os.stat(path)
+            digest.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _is_cached(self, output_path: str, fingerprint_path: str, fingerprint: str) -> bool:
+        """Whether output_path was built from inputs matching fingerprint."""
+        if not os.path.exists(output_path) or not os.path.exists(fingerprint_path):
+            return False
+        try:
+            with open(fingerprint_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("fingerprint") == fingerprint
+        except (OSError, ValueError):
+            return False
+
+    def _file_digest(self, path: str) -> str:
+        """Short content digest of a file, used to version cached outputs."""
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()[:12]
+
     def process_video(
-        self, clip_results: List[Dict], clips: List[Dict], job_id: str
+        self,
+        clip_results: List[Dict],
+        clips: List[Dict],
+        job_id: str,
+        package_hls: bool = None,
     ) -> Dict:
         """
         Full video processing: concatenate clips and add captions.
@@ -186,6 +438,8 @@ class VideoProcessor:
             clip_results: Results from Sora generation with video paths
             clips: Original clip data with narration text
             job_id: Job identifier
+            package_hls: Also segment the final video into HLS
+                (defaults to HLS_ENABLED)
 
         Returns:
             Dict with status and output path or error
@@ -208,8 +462,28 @@ class VideoProcessor:
 
         final_path = os.path.join(job_dir, "final.mp4")
 
-        # Concatenate clips (no captions - user handles that separately)
-        if not self.concatenate_clips(video_paths, final_path):
-            return {"status": "failed", "error": "Failed to concatenate clips"}
-
-        return {"status": "completed", "output_path": final_path}
+        # Concatenate clips (no captions - user handles that separately),
+        # reusing the existing final.mp4 when its inputs haven't changed
+        fingerprint = self._inputs_fingerprint(video_paths)
+        fingerprint_path = os.path.join(job_dir, "final.inputs.json")
+        if not self._is_cached(final_path, fingerprint_path, fingerprint):
+            if not self.concatenate_clips(video_paths, final_path):
+                return {"status": "failed", "error": "Failed to concatenate clips"}
+            with open(fingerprint_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint}, f)
+
+        completed_ids = {r["clip_id"] for r in successful}
+        result = {
+            "status": "completed",
+            "output_path": final_path,
+            # Clips left out of the final video; repair the job to fill them in
+            "missing_clips": [c["id"] for c in clips if c["id"] not in completed_ids],
+        }
+
+        if package_hls is None:
+            package_hls = HLS_ENABLED
+
+        if package_hls:
+            result["hls"] = self.package_hls(final_path, job_id)
+
+        return result
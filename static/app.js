@@ -8,8 +8,9 @@ let aiState = {
     clipCount: 3,
     duration: 4,
     prompts: [],
-    clips: [],       // { prompt, clipId, status, pollInterval, error }
-    mode: 'manual'
+    clips: [],       // { prompt, clipId, status, stage, hasDraft, pollInterval, error }
+    mode: 'manual',
+    draft: false     // render a fast sora-2 preview first, finalize on demand
 };
 
 const DURATION_OPTIONS = {
@@ -90,6 +91,17 @@ document.addEventListener('DOMContentLoaded', () => {
         updateAiCost();
     });
 
+    initButtonGroup('ai-draft-group', (value) => {
+        aiState.draft = value === 'on';
+    });
+
+    // Finalize buttons on draft clips
+    document.getElementById('ai-prompts-list').addEventListener('click', (e) => {
+        const btn = e.target.closest('.finalize-btn');
+        if (!btn) return;
+        finalizeAiClip(parseInt(btn.dataset.index));
+    });
+
     // Generate Script button
     document.getElementById('ai-generate-prompts-btn').addEventListener('click', generateScript);
 
@@ -207,7 +219,7 @@ function renderPromptCards() {
             </div>
             <textarea class="ai-prompt-text" data-index="${index}">${clip.prompt}</textarea>
             <div class="ai-clip-status" data-index="${index}">
-                ${renderAiClipStatus(clip)}
+                ${renderAiClipStatus(clip, index)}
             </div>
         `;
 
@@ -224,23 +236,50 @@ function renderPromptCards() {
 }
 
 // Render status for an AI clip
-function renderAiClipStatus(clip) {
+function renderAiClipStatus(clip, index) {
+    const draftVideo = clip.hasDraft
+        ? `<video controls src="/api/preview-clip/${clip.clipId}?stage=draft"></video>`
+        : '';
+    const finalizeBtn = `<button class="primary-btn finalize-btn" data-index="${index}">Finalize</button>`;
+
     switch (clip.status) {
         case 'generating':
-            return '<div class="spinner"></div><p class="status-text">Generating video...</p>';
+            // Keep the draft on screen while the final render runs
+            return `${draftVideo}<div class="spinner"></div><p class="status-text">${generatingText(clip)}</p>`;
         case 'completed':
             return `
                 <video controls src="/api/preview-clip/${clip.clipId}"></video>
                 <div class="ai-clip-actions">
+                    ${clip.stage === 'draft' ? finalizeBtn : ''}
                     <a href="/api/download-clip/${clip.clipId}" class="secondary-btn download-link">Download</a>
                 </div>`;
         case 'failed':
+            if (clip.hasDraft) {
+                return `${draftVideo}<p class="error-text">Error: ${clip.error || 'Generation failed'}</p>
+                    <div class="ai-clip-actions">${finalizeBtn}</div>`;
+            }
             return `<p class="error-text">Error: ${clip.error || 'Generation failed'}</p>`;
         default:
             return '';
     }
 }
 
+// Status text for a generating clip, with the server's ETA when it has one
+function generatingText(clip) {
+    if (clip.eta == null) return 'Generating video...';
+    if (clip.eta < 5) return 'Generating video... almost done';
+    const minutes = Math.floor(clip.eta / 60);
+    const seconds = clip.eta % 60;
+    const remaining = minutes > 0 ? `${minutes}m ${seconds}s` : `${seconds}s`;
+    return `Generating video... ~${remaining} left`;
+}
+
+// Update the ETA text inside a status area without re-rendering it
+function updateEtaText(statusArea, clip) {
+    const text = statusArea ? statusArea.querySelector('.status-text') : null;
+    if (text) text.textContent = generatingText(clip);
+}
+
 // Refresh a single AI prompt card in place
 function refreshAiCard(index) {
     const cards = document.querySelectorAll('.ai-prompt-card');
@@ -254,7 +293,7 @@ function refreshAiCard(index) {
     card.classList.toggle('failed', clip.status === 'failed');
 
     const statusArea = card.querySelector('.ai-clip-status');
-    statusArea.innerHTML = renderAiClipStatus(clip);
+    statusArea.innerHTML = renderAiClipStatus(clip, index);
 }
 
 // Generate All Videos
@@ -280,6 +319,9 @@ async function generateAllVideos() {
         clip.status = 'generating';
         clip.error = null;
         clip.clipId = null;
+        clip.eta = null;
+        clip.stage = null;
+        clip.hasDraft = false;
         refreshAiCard(i);
 
         try {
@@ -290,7 +332,8 @@ async function generateAllVideos() {
                     prompt,
                     duration: aiState.duration,
                     api_key: apiKey || undefined,
-                    model: aiState.model
+                    model: aiState.model,
+                    draft: aiState.draft
                 })
             });
 
@@ -301,6 +344,7 @@ async function generateAllVideos() {
             }
 
             clip.clipId = data.clip_id;
+            clip.stage = data.stage;
             startAiClipPolling(i);
         } catch (error) {
             clip.status = 'failed';
@@ -326,6 +370,9 @@ function startAiClipPolling(index) {
                 throw new Error(data.error || 'Failed to get status');
             }
 
+            clip.stage = data.stage;
+            clip.hasDraft = data.has_draft;
+
             if (data.status === 'completed') {
                 clearInterval(clip.pollInterval);
                 clip.pollInterval = null;
@@ -337,6 +384,10 @@ function startAiClipPolling(index) {
                 clip.status = 'failed';
                 clip.error = data.error || 'Generation failed';
                 refreshAiCard(index);
+            } else {
+                clip.eta = data.eta_seconds;
+                const card = document.querySelectorAll('.ai-prompt-card')[index];
+                updateEtaText(card && card.querySelector('.ai-clip-status'), clip);
             }
         } catch (error) {
             clearInterval(clip.pollInterval);
@@ -348,6 +399,37 @@ function startAiClipPolling(index) {
     }, 3000);
 }
 
+// Queue the full-quality render for a draft clip
+async function finalizeAiClip(index) {
+    const clip = aiState.clips[index];
+    if (!clip || !clip.clipId) return;
+
+    const apiKey = getApiKey();
+
+    try {
+        const response = await fetch(`/api/finalize-clip/${clip.clipId}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ api_key: apiKey || undefined })
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to finalize clip');
+        }
+
+        clip.status = 'generating';
+        clip.stage = data.stage;
+        clip.error = null;
+        clip.eta = null;
+        refreshAiCard(index);
+        startAiClipPolling(index);
+    } catch (error) {
+        alert('Error: ' + error.message);
+    }
+}
+
 // Render clip boxes into #storyboard, preserving existing prompts
 function updateStoryboard(count) {
     const storyboard = document.getElementById('storyboard');
@@ -480,7 +562,7 @@ function updateStoryboard(count) {
 function renderStatusArea(clip) {
     switch (clip.status) {
         case 'generating':
-            return '<div class="spinner"></div><p class="status-text">Generating video...</p>';
+            return `<div class="spinner"></div><p class="status-text">${generatingText(clip)}</p>`;
         case 'completed':
             return `<video controls src="/api/preview-clip/${clip.clipId}"></video>`;
         case 'failed':
@@ -553,6 +635,7 @@ async function generateClip(index) {
     clip.status = 'generating';
     clip.error = null;
     clip.clipId = null;
+    clip.eta = null;
     refreshClipBox(index);
 
     try {
@@ -610,6 +693,10 @@ function startClipPolling(index) {
                 clip.status = 'failed';
                 clip.error = data.error || 'Generation failed';
                 refreshClipBox(index);
+            } else {
+                clip.eta = data.eta_seconds;
+                const box = document.querySelectorAll('.clip-box')[index];
+                updateEtaText(box && box.querySelector('.clip-status-area'), clip);
             }
         } catch (error) {
             clearInterval(clip.pollInterval);